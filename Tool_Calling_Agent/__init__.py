@@ -3,3 +3,4 @@ from .conversation import WikipediaAgent
 from .tool_implementations import WikipediaToolHandler
 from .config import OpenAIClientManager
 from .logger import logger
+from .cache import ToolResultCache
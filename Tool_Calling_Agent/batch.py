@@ -0,0 +1,90 @@
+import asyncio
+import orjson
+from openai.types.chat import ChatCompletion
+from Tool_Calling_Agent.logger import logger
+
+
+class ChatBatchSubmitter:
+    """
+    Submits a set of chat completion requests as one OpenAI Batch API job.
+    Used to compute the opening LLM turn of every query in a single submission
+    instead of one live request per query.
+    """
+
+    # Batch states after which polling stops
+    TERMINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+    def __init__(self, client, poll_interval: float = 10.0, completion_window: str = "24h"):
+        """
+        Stores the async client and polling settings.
+        """
+        self.client = client
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        logger.info("ChatBatchSubmitter initialized")
+
+    async def submit(self, bodies: list) -> list:
+        """
+        Uploads `bodies` (chat completion request params) as a JSONL batch, waits
+        for the job to finish, and returns a ChatCompletion per body in the same order.
+        Entries that failed (or the whole list, if the batch failed) are None so the
+        caller can fall back to live requests.
+        """
+        payload = b"\n".join(
+            orjson.dumps(
+                {
+                    "custom_id": f"request-{index}",
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": body,
+                }
+            )
+            for index, body in enumerate(bodies)
+        )
+        results = [None] * len(bodies)
+
+        try:
+            batch_file = await self.client.files.create(
+                file=("batch_input.jsonl", payload), purpose="batch"
+            )
+            batch = await self.client.batches.create(
+                input_file_id=batch_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window=self.completion_window,
+            )
+            logger.info("Submitted batch %s with %s requests", batch.id, len(bodies))
+
+            while batch.status not in self.TERMINAL_STATES:
+                await asyncio.sleep(self.poll_interval)
+                batch = await self.client.batches.retrieve(batch.id)
+                logger.debug("Batch %s status: %s", batch.id, batch.status)
+
+            if batch.status != "completed" or not batch.output_file_id:
+                logger.error("Batch %s ended with status '%s'", batch.id, batch.status)
+                return results
+
+            output = await self.client.files.content(batch.output_file_id)
+        except Exception as e:
+            logger.error("Batch submission failed: %s", e)
+            return results
+
+        for line in output.content.splitlines():
+            if not line.strip():
+                continue
+            record = orjson.loads(line)
+            index = int(record["custom_id"].rsplit("-", 1)[1])
+            response = record.get("response") or {}
+            if response.get("status_code") == 200:
+                results[index] = ChatCompletion.model_validate(response["body"])
+            else:
+                logger.warning(
+                    "Batch request %s failed: %s", record["custom_id"], record.get("error")
+                )
+
+        logger.info(
+            "Batch %s returned %s/%s results",
+            batch.id,
+            sum(r is not None for r in results),
+            len(bodies),
+        )
+        return results
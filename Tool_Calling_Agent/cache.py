@@ -0,0 +1,95 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from diskcache import Cache
+from Tool_Calling_Agent.logger import logger
+
+
+class ToolResultCache:
+    """
+    Two-tier memoization for Wikipedia tool results.
+    A small in-process LRU answers hot keys without touching disk, and a persistent
+    disk cache lets repeated lookups skip the network across runs.
+    """
+
+    def __init__(self, directory: str = ".wiki_cache", expire: int = 86400, maxsize: int = 1024):
+        """
+        Opens (or creates) the on-disk cache at `directory`.
+        Entries expire after `expire` seconds; up to `maxsize` are also kept in memory.
+        """
+        self._disk = Cache(directory)
+        self._expire = expire
+        self._maxsize = maxsize
+        self._memory = OrderedDict()
+        # Tool handlers use the cache from the event loop, but get/set are plain sync
+        # methods that may also be called from other threads, so guard the in-memory LRU
+        self._lock = threading.Lock()
+        # In-flight lookups by key, so concurrent misses share one request
+        self._inflight = {}
+        logger.info("ToolResultCache initialized at '%s' (expire=%ss)", directory, expire)
+
+    def get(self, key: tuple):
+        """
+        Returns the cached value for `key`, or None on a miss.
+        Disk hits are promoted into the in-memory LRU.
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                logger.debug("Memory cache hit: %s", key)
+                return self._memory[key]
+
+        value = self._disk.get(key)
+        if value is not None:
+            logger.debug("Disk cache hit: %s", key)
+            self._remember(key, value)
+        return value
+
+    def set(self, key: tuple, value):
+        """
+        Stores `value` under `key` in both tiers.
+        """
+        self._disk.set(key, value, expire=self._expire)
+        self._remember(key, value)
+
+    async def fetch(self, key: tuple, produce):
+        """
+        Async memoization: returns the cached value for `key`, otherwise awaits
+        `produce()` (a zero-argument coroutine function) and caches its result.
+        Concurrent misses for the same key await a single call; if it raises, the
+        error reaches every waiter and nothing is cached.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._produce(key, produce))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            logger.debug("Joining in-flight lookup: %s", key)
+        # Shielded so one cancelled waiter does not cancel the lookup for the others
+        return await asyncio.shield(task)
+
+    async def drain(self):
+        """
+        Cancels lookups still in flight (e.g. unused speculative ones) and waits for them
+        to unwind, so none is left using an HTTP client that is about to be closed.
+        """
+        tasks = list(self._inflight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _produce(self, key: tuple, produce):
+        value = await produce()
+        self.set(key, value)
+        return value
+
+    def _remember(self, key: tuple, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            if len(self._memory) > self._maxsize:
+                self._memory.popitem(last=False)
@@ -1,19 +1,72 @@
-import os
-from openai import OpenAI
+import asyncio
+import threading
+import weakref
+import httpx
+from openai import AsyncOpenAI
 from Tool_Calling_Agent.logger import logger
 
 
 class OpenAIClientManager:
-    """Singleton manager for initializing and accessing the OpenAI client."""
+    """
+    Manager for the async OpenAI client, one instance per running event loop.
+    Pooled connections are bound to the loop that opened them, so a client is never
+    carried over into a later asyncio.run().
+    """
 
-    # Class-level variable to hold the OpenAI client instance
-    _client = None
+    # Clients keyed by event loop; entries vanish with their loop
+    _clients = weakref.WeakKeyDictionary()
+    # Guards first-time creation when loops in several threads ask at once
+    _lock = threading.Lock()
 
     @classmethod
     def get_client(cls):
-        if cls._client is None:
-            base_url = "http://10.246.250.226:12300/v1"
-            api_key = "none"
-            cls._client = OpenAI(base_url=base_url, api_key=api_key)
-            logger.info(f"OpenAI client initialized with base_url={base_url}")
-        return cls._client
+        """Returns the client for the running event loop, creating it on first use."""
+        loop = asyncio.get_running_loop()
+        client = cls._clients.get(loop)
+        if client is None:
+            with cls._lock:
+                client = cls._clients.get(loop)
+                if client is None:
+                    client = cls._create_client()
+                    cls._clients[loop] = client
+        return client
+
+    @staticmethod
+    def _create_client():
+        base_url = "http://10.246.250.226:12300/v1"
+        api_key = "none"
+        # Pool sized for many concurrent conversations instead of httpx's 100-connection default
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=512, max_keepalive_connections=256),
+            http2=True,
+            timeout=httpx.Timeout(120.0),
+        )
+        # The tenacity policy in conversation.py is the single retry layer;
+        # the SDK's own retries (2 by default) would multiply with it
+        client = AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            http_client=http_client,
+            max_retries=0,
+        )
+        logger.info("OpenAI client initialized with base_url=%s", base_url)
+        return client
+
+    @classmethod
+    async def aclose(cls):
+        """Closes the running loop's client, if one was created."""
+        client = cls._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+    @classmethod
+    async def warm_up(cls):
+        """
+        Issues a cheap /models request so the first real completion does not pay
+        the connection setup cost. Failures are logged and otherwise ignored.
+        """
+        try:
+            await cls.get_client().models.list()
+            logger.debug("OpenAI connection warmed up")
+        except Exception as e:
+            logger.warning("OpenAI warm-up request failed: %s", e)
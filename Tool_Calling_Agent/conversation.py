@@ -1,107 +1,515 @@
-import json
+import asyncio
+import logging
+import os
+import re
+from collections import deque
+import openai
+import orjson
+from tenacity import (
+    before_sleep_log,
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
 from Tool_Calling_Agent.config import OpenAIClientManager
 from Tool_Calling_Agent.tool_definitions import functions
 from Tool_Calling_Agent.tool_implementations import WikipediaToolHandler
-from Tool_Calling_Agent.utils import FunctionCallParser
+from Tool_Calling_Agent.utils import BoundedKeySet, FunctionCallParser
 from Tool_Calling_Agent.logger import logger
 
+# Retry policy for LLM requests: transient connection, rate-limit and 5xx errors are
+# retried with jittered exponential backoff instead of failing the whole conversation
+_llm_retry = retry(
+    stop=stop_after_attempt(4),
+    wait=wait_random_exponential(min=0.5, max=8),
+    retry=retry_if_exception_type(
+        (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+    ),
+    before_sleep=before_sleep_log(logger, logging.WARNING),
+    reraise=True,
+)
+
+# Servers with native tool calling never need the text parser; set AGENT_TEXT_FALLBACK=1
+# for backends that write calls like search_wikipedia(query="...") into the message text
+ALLOW_TEXT_FALLBACK = os.getenv("AGENT_TEXT_FALLBACK", "0") == "1"
+
+# A quoted, capitalized span in the user query (e.g. the page 'Times Square'),
+# taken as a likely page title
+_QUOTED_TITLE_RE = re.compile(r"""(?:^|(?<=\s))['"]([A-Z0-9][^'"]{1,79})['"](?!\w)""")
+
+
+def _freeze(value):
+    """Convert parsed JSON arguments into a hashable equivalent (dicts -> frozensets, lists -> tuples)."""
+    if isinstance(value, dict):
+        return frozenset((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
 
 class WikipediaAgent:
     """Agent that interacts with Wikipedia using function-calling LLM."""
 
-    def __init__(self, system_prompt: str):
-        """Initialize the agent with prompt, tools, and client."""
+    # Rough characters-per-token ratio used to estimate context size
+    CHARS_PER_TOKEN = 4
+    # Prefix marking a tool result that has already been collapsed
+    SYNOPSIS_PREFIX = "[prior tool result summarized: "
+
+    # Question put to the draft model after each tool result
+    DRAFT_PROMPT = (
+        "Based on the conversation so far, is another Wikipedia function call needed "
+        "before the original question can be answered? Reply with only 'yes' or 'no'."
+    )
+
+    def __init__(self, system_prompt: str, max_iterations: int = 5, draft_model: str = None):
+        """
+        Initialize the agent with prompt, tools, and client.
+        If `draft_model` is set, a small model decides after each tool result whether
+        another tool call is needed, letting the agent skip straight to the final answer.
+        """
         self.system_prompt = system_prompt
-        self.client = OpenAIClientManager.get_client()
         self.functions = functions
         self.tool_handler = WikipediaToolHandler()
-        self.max_iterations = 10
+        self.model = "gpt-3.5-turbo"
+        self.draft_model = draft_model
+        self.max_iterations = max_iterations
+        # Above this estimated size, older tool results are collapsed to one-line synopses
+        self.context_token_budget = 3000
+        # Number of most recent assistant/tool exchanges kept in the context window
+        self.max_history_turns = 6
+        # Tool results older than this many turns are always collapsed to synopses
+        self.full_result_turns = 2
+        # Cap on remembered tool calls and fetched pages used to skip repeats
+        self.max_seen_calls = 256
+        # Warm the tool cache for titles quoted in the query while the first turn is generated
+        self.speculative_prefetch = True
+        # At most this many quoted titles are prefetched per query
+        self.max_speculative_titles = 2
+        # Built once and shared by every request: the system message and the static
+        # request parameters; neither is mutated afterwards
+        self._system_message = {"role": "system", "content": system_prompt}
+        self._draft_message = {"role": "user", "content": self.DRAFT_PROMPT}
+        self._base_params = {
+            "model": self.model,
+            "tools": self.functions,
+            "tool_choice": "auto",
+            "parallel_tool_calls": True,
+        }
         logger.info("WikipediaAgent initialized")
 
-    def run_conversation(self, user_query: str) -> str:
-        """Run a multi-turn conversation loop with tool-calling."""
-        logger.info(f"Starting new conversation for query: '{user_query}'")
+    @property
+    def client(self):
+        """The OpenAI client for the running event loop."""
+        return OpenAIClientManager.get_client()
+
+    def initial_messages(self, user_query: str) -> list:
+        """Build the opening context: system prompt followed by the user query."""
+        return [self._system_message, {"role": "user", "content": user_query}]
+
+    def request_params(self, messages: list) -> dict:
+        """Build the chat completion request parameters for the given messages."""
+        return {**self._base_params, "messages": messages}
 
-        # Start conversation with system prompt and user query
-        messages = [
-            {"role": "system", "content": self.system_prompt},
-            {"role": "user", "content": user_query},
+    @staticmethod
+    def _message_parts(message):
+        """Split a complete assistant message into its text content and tool call dicts."""
+        tool_calls = [
+            {
+                "id": tool_call.id,
+                "type": "function",
+                "function": {
+                    "name": tool_call.function.name,
+                    "arguments": tool_call.function.arguments or "",
+                },
+            }
+            for tool_call in getattr(message, "tool_calls", None) or []
         ]
-        function_calls_made = set()
-        processed_pages = set()
+        return message.content, tool_calls
 
-        for iteration in range(self.max_iterations):
-            logger.debug(f"Iteration {iteration + 1}: Sending to LLM")
-
-            # Send current messages to LLM with tool-calling support
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                functions=self.functions,
-                function_call="auto",
+    @staticmethod
+    def _arguments_complete(arguments: str) -> bool:
+        """True once a streamed arguments buffer holds a complete JSON object."""
+        if not arguments.rstrip().endswith("}"):
+            return False
+        try:
+            orjson.loads(arguments)
+        except orjson.JSONDecodeError:
+            return False
+        return True
+
+    @_llm_retry
+    async def _stream_completion(self, messages: list, on_tool_call=None, on_abort=None):
+        """
+        Stream the LLM's next turn and return (content, tool_calls).
+        Tool call deltas are accumulated per index, since the model may emit several
+        calls in one turn. If given, `on_tool_call(index, tool_call)` is invoked for each
+        call as soon as its arguments form complete JSON, so it can start while the rest
+        of the turn is still being generated; calls still open when the stream ends are
+        handed over then. If the attempt fails, `on_abort()` is invoked before the error
+        propagates, so calls it started can be discarded: a retry samples a new turn that
+        need not contain them.
+        """
+        try:
+            return await self._stream_attempt(messages, on_tool_call)
+        except BaseException:
+            if on_abort is not None:
+                on_abort()
+            raise
+
+    async def _stream_attempt(self, messages: list, on_tool_call):
+        stream = await self.client.chat.completions.create(
+            **self.request_params(messages), stream=True
+        )
+        content_parts = []
+        calls = {}
+        dispatched = set()
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content_parts.append(delta.content)
+                for tool_call in delta.tool_calls or []:
+                    entry = calls.setdefault(
+                        tool_call.index,
+                        {"id": "", "type": "function", "function": {"name": "", "arguments": ""}},
+                    )
+                    if tool_call.id:
+                        entry["id"] = tool_call.id
+                    if tool_call.function:
+                        entry["function"]["name"] += tool_call.function.name or ""
+                        entry["function"]["arguments"] += tool_call.function.arguments or ""
+                    if (
+                        on_tool_call is not None
+                        and tool_call.index not in dispatched
+                        and self._arguments_complete(entry["function"]["arguments"])
+                    ):
+                        dispatched.add(tool_call.index)
+                        on_tool_call(tool_call.index, entry)
+        finally:
+            await stream.close()
+
+        tool_calls = [calls[index] for index in sorted(calls)]
+        if on_tool_call is not None:
+            for index in sorted(calls.keys() - dispatched):
+                on_tool_call(index, calls[index])
+        content = "".join(content_parts) or None
+        return content, tool_calls
+
+    async def _needs_tool_call(self, messages: list) -> bool:
+        """
+        Ask the draft model whether another tool call is needed.
+        Any failure or unclear reply counts as 'yes' so the main loop proceeds as usual.
+        """
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.draft_model,
+                messages=messages + [self._draft_message],
+                max_tokens=3,
+                temperature=0,
+            )
+        except Exception as e:
+            logger.warning("Draft model check failed, continuing with main model: %s", e)
+            return True
+        verdict = (response.choices[0].message.content or "").strip().lower()
+        logger.debug("Draft model verdict: '%s'", verdict)
+        return not verdict.startswith("no")
+
+    @_llm_retry
+    async def _final_answer(self, messages: list) -> str:
+        """Ask the main model for the final answer with tool calling disabled."""
+        params = self.request_params(messages)
+        params["tool_choice"] = "none"
+        response = await self.client.chat.completions.create(**params)
+        return (response.choices[0].message.content or "").strip()
+
+    @staticmethod
+    def _context(prefix: list, turns: deque) -> list:
+        """Flatten the fixed prefix and the windowed turns into the message list sent to the LLM."""
+        return prefix + [message for turn in turns for message in turn]
+
+    def _estimate_tokens(self, messages: list) -> int:
+        """Cheaply estimate the prompt size of `messages` in tokens."""
+        return sum(len(m.get("content") or "") for m in messages) // self.CHARS_PER_TOKEN
+
+    def _summarize_tool_message(self, message: dict, name: str):
+        """Replace a tool result in place by a one-line synopsis (once; synopses are kept as is)."""
+        content = message["content"]
+        if content.startswith(self.SYNOPSIS_PREFIX):
+            return
+        preview = " ".join(content.split())[:80]
+        message["content"] = f"{self.SYNOPSIS_PREFIX}{name} -> {preview}...]"
+        logger.debug("Summarized earlier '%s' result to save context", name)
+
+    def _collapse_turn(self, turn: list):
+        """Summarize every tool result of one assistant/tool exchange."""
+        names = {
+            tool_call["id"]: tool_call["function"]["name"] for tool_call in turn[0]["tool_calls"]
+        }
+        for message in turn[1:]:
+            self._summarize_tool_message(message, names.get(message["tool_call_id"], "tool"))
+
+    def _collapse_old_turns(self, turns: deque, turn_claims: deque, keep: int):
+        """
+        Collapse every not yet collapsed turn except the newest `keep`. `turn_claims` holds
+        the dedup keys of the uncollapsed turns, oldest first (they are the last
+        len(turn_claims) entries of `turns`). A collapsed turn's keys are released: its
+        full results are gone from the context, so the model may ask for them again, and
+        the re-fetch is served by the tool cache.
+        """
+        while len(turn_claims) > keep:
+            self._release(turn_claims.popleft())
+            # Turns already dropped from the bounded window have nothing left to collapse
+            if len(turns) > len(turn_claims):
+                self._collapse_turn(turns[-len(turn_claims) - 1])
+
+    def _schedule(
+        self,
+        tool_call: dict,
+        scheduled: dict,
+        function_calls_made: BoundedKeySet,
+        processed_pages: BoundedKeySet,
+    ):
+        """
+        Start one tool call as a task after checking for repeats, and return
+        (outcome, claimed): the task (or a plain string answer) and the
+        (key set, key) pairs this call added, so the caller can release them later.
+        A call identical to one already scheduled this turn shares that call's task;
+        a call repeated from an earlier turn is answered with a plain string instead.
+        """
+        func_name = tool_call["function"]["name"]
+        claimed = []
+        try:
+            args = orjson.loads(tool_call["function"]["arguments"] or "{}")
+        except orjson.JSONDecodeError:
+            logger.error(
+                "Invalid JSON arguments for '%s': %s", func_name, tool_call["function"]["arguments"]
             )
-            msg = response.choices[0].message
-            logger.debug(f"LLM responded with: {msg.content}")
-            messages.append({"role": "assistant", "content": msg.content or ""})
-
-            func_name = None
-            args = {}
-
-            # Extract function call if LLM provided one
-            if hasattr(msg, "function_call") and msg.function_call:
-                func_name = msg.function_call["name"]
-                args = json.loads(msg.function_call["arguments"])
-                logger.info(f"Function call requested: {func_name} with args: {args}")
+            return "Error: arguments were not valid JSON", claimed
+        if not isinstance(args, dict):
+            logger.error("Non-object arguments for '%s': %s", func_name, args)
+            return "Error: arguments must be a JSON object", claimed
+
+        # Avoid redundant function calls
+        call_key = (func_name, _freeze(args))
+        if call_key in scheduled:
+            logger.debug("Duplicate call to %s in the same turn; sharing its result", func_name)
+            return scheduled[call_key], claimed
+        if call_key in function_calls_made:
+            logger.warning("Repeated function call: %s with same args. Skipping.", func_name)
+            return "Already called", claimed
+        function_calls_made.add(call_key)
+        claimed.append((function_calls_made, call_key))
+
+        try:
+            args, skipped = self._claim_pages(func_name, args, processed_pages, claimed)
+        except TypeError as e:
+            # Titles of the wrong type (e.g. a list where a string is expected)
+            logger.error("Invalid arguments for '%s': %s", func_name, e)
+            return f"Error: invalid arguments for '{func_name}': {e}", claimed
+        if skipped is not None:
+            return skipped, claimed
+
+        logger.info("Function call requested: %s with args: %s", func_name, args)
+        task = asyncio.create_task(self._dispatch(func_name, args))
+        scheduled[call_key] = task
+        return task, claimed
+
+    @staticmethod
+    def _claim_pages(func_name: str, args: dict, processed_pages: BoundedKeySet, claimed: list):
+        """
+        Apply the per-conversation page guard (the tool handler itself is shared by all
+        conversations). Returns (args, None) with already fetched titles filtered out, or
+        (args, message) if every requested page was fetched before. Newly fetched titles
+        are added to `claimed`. Raises TypeError for unhashable titles.
+        """
+        if func_name == "fetch_wikipedia_page":
+            title = args.get("title", "")
+            if title in processed_pages:
+                logger.warning("Skipping previously fetched page: %s", title)
+                return args, "Page already processed"
+            processed_pages.add(title)
+            claimed.append((processed_pages, title))
+        elif func_name == "fetch_wikipedia_pages":
+            titles = args.get("titles") or []
+            if isinstance(titles, str):
+                titles = [titles]
+            fresh = [title for title in titles if title not in processed_pages]
+            if titles and not fresh:
+                logger.warning("Skipping previously fetched pages: %s", titles)
+                return args, "Pages already processed"
+            processed_pages.update(fresh)
+            claimed.extend((processed_pages, title) for title in fresh)
+            args = {**args, "titles": fresh}
+        return args, None
+
+    @staticmethod
+    def _release(claimed: list):
+        """Forget the dedup keys recorded by _schedule, so those calls may be made again."""
+        for keys, key in claimed:
+            keys.discard(key)
+
+    async def _dispatch(self, func_name: str, args: dict) -> str:
+        """
+        Execute one tool call and return the content of its tool message.
+        Every handler is a coroutine, so concurrent calls from the same turn (and from
+        other conversations) overlap their round-trips on the event loop.
+        """
+        # Route function call to appropriate implementation
+        handler = self.tool_handler.dispatch.get(func_name)
+        if handler is None:
+            result = "Unknown function"
+            logger.error("Unknown function '%s' requested.", func_name)
+        else:
+            try:
+                result = await handler(**args)
+            except TypeError as e:
+                # Arguments that do not match the handler's parameters
+                result = f"Error: invalid arguments for '{func_name}': {e}"
+                logger.error("Invalid arguments for '%s': %s", func_name, e)
+
+        logger.info("Result of function '%s': %s", func_name, result)
+        # Strings go back verbatim and structured results as compact JSON, with no
+        # {"output": ...} wrapper to spend tokens on every later turn
+        if isinstance(result, str):
+            return result
+        return orjson.dumps(result).decode()
+
+    def _speculate(self, user_query: str) -> list:
+        """
+        Start a page fetch for each title quoted in `user_query`, so it overlaps the first
+        LLM round-trip. Results land in the shared tool cache, where the model's real call
+        finds them (or joins the request still in flight); unused ones are discarded.
+        """
+        titles = _QUOTED_TITLE_RE.findall(user_query)[: self.max_speculative_titles]
+        tasks = []
+        for title in titles:
+            logger.debug("Speculatively prefetching '%s'", title)
+            tasks.append(asyncio.create_task(self.tool_handler.fetch_page(title)))
+        return tasks
+
+    async def run_conversation(self, user_query: str, first_response=None) -> str:
+        """
+        Run a multi-turn conversation loop with tool-calling.
+        If `first_response` is given (e.g. precomputed through the Batch API), it is
+        used as the LLM's first turn instead of making a live request.
+        """
+        logger.info("Starting new conversation for query: '%s'", user_query)
+        speculative = []
+        if self.speculative_prefetch and first_response is None:
+            speculative = self._speculate(user_query)
+        try:
+            return await self._conversation_loop(user_query, first_response)
+        finally:
+            # Lookups the model never asked for are dropped; shared in-flight
+            # requests keep running for any other waiter until the handler is closed
+            for task in speculative:
+                task.cancel()
+
+    async def _conversation_loop(self, user_query: str, first_response) -> str:
+        """Drive the LLM/tool turns for one query until a final answer or max_iterations."""
+        # Start conversation with system prompt and user query; later turns live in a
+        # bounded deque so the oldest assistant/tool exchanges drop off in O(1)
+        prefix = self.initial_messages(user_query)
+        turns = deque(maxlen=self.max_history_turns)
+        messages = prefix
+        # Calls and pages seen so far, bounded so long-running loops keep flat memory
+        function_calls_made = BoundedKeySet(self.max_seen_calls)
+        processed_pages = BoundedKeySet(self.max_seen_calls)
+        # Dedup keys claimed by each turn whose tool results are still in full, oldest first
+        turn_claims = deque()
+
+        for iteration in range(self.max_iterations):
+            # This turn's tool calls by stream index, as (outcome, claimed) pairs; calls
+            # streamed with complete arguments are started before the turn finishes
+            scheduled = {}
+            started = {}
+
+            def start(index, tool_call):
+                started[index] = self._schedule(
+                    tool_call, scheduled, function_calls_made, processed_pages
+                )
+
+            def discard():
+                # A failed streaming attempt: its calls are not part of any accepted turn
+                for task in scheduled.values():
+                    task.cancel()
+                for _, claimed in started.values():
+                    self._release(claimed)
+                scheduled.clear()
+                started.clear()
+
+            if iteration == 0 and first_response is not None:
+                logger.debug("Iteration 1: Using precomputed first response")
+                content, tool_calls = self._message_parts(first_response.choices[0].message)
             else:
-                # Parse function call from message text if not explicitly formatted
-                func_name, args = FunctionCallParser.parse(msg.content or "")
+                # Once tool results are in, let the draft model short-circuit to the answer
+                if iteration > 0 and self.draft_model:
+                    if not await self._needs_tool_call(messages):
+                        final_response = await self._final_answer(messages)
+                        logger.info(
+                            "Final user-facing response (draft model skipped tools): %s",
+                            final_response,
+                        )
+                        return final_response
+                logger.debug("Iteration %s: Sending to LLM", iteration + 1)
+                content, tool_calls = await self._stream_completion(messages, start, discard)
+            logger.debug("LLM responded with: %s", content)
+
+            if not tool_calls:
+                # Without structured tool calls the reply is the final answer, unless
+                # the text fallback is enabled and finds a call written out in the text
+                func_name, args = None, {}
+                if ALLOW_TEXT_FALLBACK:
+                    func_name, args = FunctionCallParser.parse(content or "")
                 if not func_name:
-                    final_response = msg.content.strip()
+                    final_response = (content or "").strip()
                     logger.info(
-                        f"Final user-facing response (no function needed): {final_response}"
+                        "Final user-facing response (no function needed): %s",
+                        final_response,
                     )
                     return final_response
+                tool_calls = [
+                    {
+                        "id": "",
+                        "type": "function",
+                        "function": {"name": func_name, "arguments": orjson.dumps(args).decode()},
+                    }
+                ]
 
-            # Avoid redundant function calls
-            call_key = f"{func_name}{json.dumps(args, sort_keys=True)}"
-            if call_key in function_calls_made:
-                logger.warning(
-                    f"Repeated function call: {func_name} with same args. Skipping."
-                )
-                messages.append(
-                    {"role": "function", "name": func_name, "content": "Already called"}
-                )
-                continue
-            function_calls_made.add(call_key)
-
-            # Route function call to appropriate implementation
-            if func_name == "search_wikipedia":
-                result = self.tool_handler.search(args.get("query", ""))
-            elif func_name == "fetch_wikipedia_page":
-                title = args.get("title", "")
-                if title in processed_pages:
-                    result = "Page already processed"
-                    logger.warning(f"Skipping previously fetched page: {title}")
-                else:
-                    result = self.tool_handler.fetch_page(title)
-                    processed_pages.add(title)
-            elif func_name == "wikipedia_assist":
-                mode = args.pop("mode", None)
-                result = self.tool_handler.assist(mode, **args)
-            else:
-                result = "Unknown function"
-                logger.error(f"Unknown function '{func_name}' requested.")
-
-            logger.info(f"Result of function '{func_name}': {result}")
-
-            # Append tool response back into conversation context
-            messages.append(
-                {
-                    "role": "function",
-                    "name": func_name,
-                    "content": json.dumps({"output": result}),
-                }
-            )
+            # Servers that omit call ids still need unique ids to pair results with calls
+            for index, tool_call in enumerate(tool_calls):
+                if not tool_call["id"]:
+                    tool_call["id"] = f"call_{iteration}_{index}"
+
+            turn = [{"role": "assistant", "content": content or "", "tool_calls": tool_calls}]
+            turns.append(turn)
+
+            # Run every distinct tool call from this turn concurrently. A streamed turn has
+            # started every call, and its tool_calls are in stream-index order; precomputed
+            # and text-parsed calls start now, indexed by position
+            if not started:
+                for index, tool_call in enumerate(tool_calls):
+                    start(index, tool_call)
+            outcomes = [started[index][0] for index in sorted(started)]
+            await asyncio.gather(*scheduled.values())
+
+            # Append tool responses back into conversation context, one per call id
+            for tool_call, outcome in zip(tool_calls, outcomes):
+                result = outcome.result() if isinstance(outcome, asyncio.Task) else outcome
+                turn.append({"role": "tool", "tool_call_id": tool_call["id"], "content": result})
+            turn_claims.append([pair for _, claimed in started.values() for pair in claimed])
+
+            # Each exchange is collapsed once, as it ages out of the full-result window, and
+            # once the context exceeds the token budget only the latest turn stays in full.
+            # Collapsing rewrites a message the server has already seen, so its prefix cache
+            # misses from there on; the stable system prompt and tools still hit every turn
+            self._collapse_old_turns(turns, turn_claims, self.full_result_turns)
+            messages = self._context(prefix, turns)
+            if self._estimate_tokens(messages) > self.context_token_budget:
+                self._collapse_old_turns(turns, turn_claims, 1)
 
         # If the loop ends without a direct answer
         logger.warning("Reached maximum iterations without a final answer.")
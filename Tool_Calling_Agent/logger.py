@@ -1,11 +1,55 @@
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
+import orjson
 
-# Configure the root logger
-logging.basicConfig(
-    filename="agent.log",
-    filemode="w",
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
+# Records are formatted on the logging thread and handed off to a queue; a background
+# listener thread does the file writes, so logging never blocks the event loop on disk I/O
+_log_queue = queue.SimpleQueue()
+
+
+class JsonLineFormatter(logging.Formatter):
+    """
+    Formats each record as one JSON object per line via orjson.
+    The timestamp is kept as the raw epoch float, skipping asctime/strftime formatting.
+    """
+
+    def format(self, record):
+        entry = {"t": record.created, "lvl": record.levelname, "msg": record.getMessage()}
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return orjson.dumps(entry).decode()
+
+
+# Append across runs and rotate at ~10 MB instead of truncating the log on every start
+_file_handler = logging.handlers.RotatingFileHandler(
+    "agent.log", maxBytes=10_000_000, backupCount=3, delay=True
 )
+# Records arrive already rendered as JSON lines (see the QueueHandler below)
+_file_handler.setFormatter(logging.Formatter("%(message)s"))
+
+_listener = logging.handlers.QueueListener(_log_queue, _file_handler)
+_listener.start()
+atexit.register(_listener.stop)
+
+# QueueHandler.prepare formats each record and strips its exc_info/stack_info before
+# enqueueing, so the JSON formatter has to run here to keep tracebacks as fields
+_queue_handler = logging.handlers.QueueHandler(_log_queue)
+_queue_handler.setFormatter(JsonLineFormatter())
+
+# Configure the root logger; WARNING by default so per-turn INFO/DEBUG records are
+# dropped before formatting. Set AGENT_LOG=INFO or DEBUG to trace the agent's steps
+_root = logging.getLogger()
+_root.addHandler(_queue_handler)
+_level = os.getenv("AGENT_LOG", "WARNING")
+_known_level = _level.upper() in logging.getLevelNamesMapping()
+_root.setLevel(_level.upper() if _known_level else logging.WARNING)
 
 logger = logging.getLogger(__name__)
+
+if not _known_level:
+    logger.warning("Unknown AGENT_LOG level %r; using WARNING", _level)
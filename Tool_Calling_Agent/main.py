@@ -1,4 +1,9 @@
-import json
+import asyncio
+import os
+import sys
+import orjson
+from Tool_Calling_Agent.batch import ChatBatchSubmitter
+from Tool_Calling_Agent.config import OpenAIClientManager
 from Tool_Calling_Agent.conversation import WikipediaAgent
 from Tool_Calling_Agent.logger import logger
 
@@ -10,16 +15,30 @@ class WikipediaQueryRunner:
     logs results, and saves output to a JSON file.
     """
 
-    def __init__(self):
+    def __init__(self, use_batch_api: bool = False, max_concurrency: int = None):
+        # When enabled, the first LLM turn of every query is submitted as one Batch API job
+        self.use_batch_api = use_batch_api
+        # Number of conversations in flight at once (AGENT_CONCURRENCY, 4 by default)
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv("AGENT_CONCURRENCY", "4"))
+        self.max_concurrency = max(1, max_concurrency)
+
         # System prompt instructing LLM to rely only on Wikipedia functions
         self.system_prompt = (
             "You are a Wikipedia assistant. You have access to the following functions:\n"
-            "1) search_wikipedia(query): Return a list of page titles related to the query.\n"
-            "2) fetch_wikipedia_page(title): Return a short summary of the Wikipedia page.\n"
-            "3) wikipedia_assist(mode, query/latitude/longitude): For suggestions (mode='suggest') or geosearch (mode='geosearch').\n\n"
+            "1) search_and_summarize(query): Return the top page titles related to the query, each with a short summary.\n"
+            "2) search_wikipedia(query): Return a list of page titles related to the query.\n"
+            "3) fetch_wikipedia_page(title): Return a short summary of the Wikipedia page.\n"
+            "4) fetch_wikipedia_pages(titles): Return short summaries for a list of page titles in one call.\n"
+            "5) wikipedia_assist(mode, query/latitude/longitude): For suggestions (mode='suggest') or geosearch (mode='geosearch').\n\n"
             "Use these functions to gather information and answer the user's query. "
+            "Prefer search_and_summarize over a search_wikipedia call followed by fetch_wikipedia_page; "
+            "use those two only when you need a specific page that search_and_summarize did not return. "
+            "To read several pages, pass all their titles to one fetch_wikipedia_pages call. "
             "If a query seems misspelled, use wikipedia_assist with mode='suggest' to get corrections. "
             "If a query asks for pages near a location, use wikipedia_assist with mode='geosearch'. "
+            "When several lookups are independent (e.g. searching for multiple topics or fetching several pages), "
+            "request them together as parallel tool calls in a single turn. "
             "When calling wikipedia_assist, specify the mode as the first argument, e.g., wikipedia_assist('suggest', query='Tmo Cruse'). "
             "Once you have sufficient information, provide a concise final answer, citing the Wikipedia pages url. "
             "You must base your answers strictly on the information returned by the functions. Do not use any prior knowledge or assumptions."
@@ -46,26 +65,79 @@ class WikipediaQueryRunner:
 
     def run(self):
         """
-        Runs all sample queries through the agent and collects results.
+        Runs all sample queries through the agent concurrently and collects results.
         Saves outputs as a JSON file.
         """
+        results = asyncio.run(self.run_all())
+
         all_results = []
-        for query in self.queries:
-            logger.info(f"Running query: {query}")
-            result = self.agent.run_conversation(query)
-            print(f"\nResult for query: {query}\n{result}\n")
-            logger.info(f"Result: {result}")
+        report = []
+        for query, result in zip(self.queries, results):
+            report.append(f"\nResult for query: {query}\n{result}\n")
+            logger.info("Result: %s", result)
             all_results.append({"query": query, "result": result})
+        # One write for the whole report instead of a flush per query
+        sys.stdout.write("\n".join(report) + "\n")
 
         self.save_results(all_results)
 
+    async def run_all(self):
+        """
+        Dispatches every query as an independent conversation and awaits them together,
+        with at most max_concurrency running at once, so wall time shrinks roughly by
+        that factor instead of growing with the sum of all queries.
+        """
+        tool_handler = self.agent.tool_handler
+        await asyncio.gather(OpenAIClientManager.warm_up(), tool_handler.warm_up())
+
+        try:
+            first_responses = [None] * len(self.queries)
+            if self.use_batch_api:
+                first_responses = await self.prefetch_first_turns()
+
+            limiter = asyncio.Semaphore(self.max_concurrency)
+
+            async def run_one(query, first_response):
+                async with limiter:
+                    logger.info("Running query: %s", query)
+                    try:
+                        return await self.agent.run_conversation(
+                            query, first_response=first_response
+                        )
+                    except Exception as e:
+                        # One failed query is recorded as its result instead of
+                        # discarding every other query's answer
+                        logger.error("Query '%s' failed: %s", query, e)
+                        return f"Error: {str(e)}"
+
+            return await asyncio.gather(
+                *(run_one(query, first) for query, first in zip(self.queries, first_responses))
+            )
+        finally:
+            # The Wikipedia HTTP client's connections are bound to this event loop; the
+            # handler opens a new client on its next use, so the runner can run again.
+            # The same goes for the OpenAI client, which is kept per event loop
+            await asyncio.gather(tool_handler.aclose(), OpenAIClientManager.aclose())
+
+    async def prefetch_first_turns(self):
+        """
+        Computes the opening LLM turn for all queries through a single Batch API job.
+        Queries whose batch entry failed get None and start with a live request instead.
+        """
+        submitter = ChatBatchSubmitter(self.agent.client)
+        bodies = [
+            self.agent.request_params(self.agent.initial_messages(query))
+            for query in self.queries
+        ]
+        return await submitter.submit(bodies)
+
     def save_results(self, results):
         """
         Saves the query-result pairs to a JSON file.
         """
-        with open(self.output_path, "w", encoding="utf-8") as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
-        logger.info(f"Results saved to {self.output_path}")
+        with open(self.output_path, "wb") as f:
+            f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+        logger.info("Results saved to %s", self.output_path)
 
 
 if __name__ == "__main__":
@@ -2,6 +2,28 @@ from Tool_Calling_Agent.logger import logger
 
 # List of function definitions that the LLM can call via tool calling.
 functions = [
+    {
+        "type": "function",
+        "function": {
+            "name": "search_and_summarize",
+            "description": (
+                "Search Wikipedia for a query and return the top matching page titles, "
+                "each with a short summary, in one call."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "The search term for Wikipedia.",
+                    }
+                },
+                "required": ["query"],
+                "additionalProperties": False,
+            },
+        },
+        "strict": True,
+    },
     {
         "type": "function",
         "function": {
@@ -40,6 +62,29 @@ functions = [
         },
         "strict": True,
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "fetch_wikipedia_pages",
+            "description": (
+                "Fetches Wikipedia page summaries for several titles in one call. "
+                "Use instead of repeated fetch_wikipedia_page calls."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "titles": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "The titles of the Wikipedia pages.",
+                    }
+                },
+                "required": ["titles"],
+                "additionalProperties": False,
+            },
+        },
+        "strict": True,
+    },
     {
         "type": "function",
         "function": {
@@ -79,5 +124,6 @@ functions = [
 
 # Log the names of all tool functions registered for use by the LLM.
 logger.info(
-    f"Tool functions registered for LLM: {[f['function']['name'] for f in functions]}"
+    "Tool functions registered for LLM: %s",
+    [f["function"]["name"] for f in functions],
 )
@@ -1,81 +1,388 @@
-import wikipedia
+import asyncio
+import logging
+import re
+from urllib.parse import quote
+import httpx
+import orjson
+from Tool_Calling_Agent.cache import ToolResultCache
 from Tool_Calling_Agent.logger import logger
 
+# MediaWiki action API; https avoids a redirect per call
+WIKIPEDIA_API_URL = "https://en.wikipedia.org/w/api.php"
+# REST endpoint returning a precomputed lead extract (~2 KB) instead of the parsed page
+WIKIPEDIA_SUMMARY_URL = "https://en.wikipedia.org/api/rest_v1/page/summary/"
+# Wikimedia asks API clients to identify themselves
+USER_AGENT = "Tool-Calling-Agent/1.0 (https://github.com/Chanakya-Nalapareddy/Tool-Calling-Agent)"
+# Per-request timeout in seconds for direct MediaWiki calls
+REQUEST_TIMEOUT = 5
+
+# MediaWiki accepts up to 50 titles per query but returns at most 20 extracts per response
+MAX_TITLES_PER_REQUEST = 20
+
+# Sentence boundary used to trim REST extracts to two sentences
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def _query_key(query) -> str:
+    """Normalizes a free-text query so trivially different spellings share a cache entry."""
+    return str(query).strip().lower()
+
+
+def _coordinate_key(value):
+    """Rounds a coordinate to 4 decimals (~10 m) so nearby repeats share a cache entry."""
+    try:
+        return round(float(value), 4)
+    except (TypeError, ValueError):
+        return value
+
+
+def _page_entry(page: dict):
+    """The summary of a page result, or the whole result if it is an error."""
+    return page["summary"] if "summary" in page else page
+
 
 class WikipediaToolHandler:
     """
     Handles Wikipedia-related functionality: search, page summary fetch, spelling suggestions, and geosearch.
     """
 
-    def __init__(self):
+    def __init__(self, cache: ToolResultCache = None, http_client: httpx.AsyncClient = None):
         """
         Initializes the Wikipedia tool handler and logs its creation.
+        Successful results are memoized in `cache` (a persistent ToolResultCache by default).
+        Direct MediaWiki calls go through `http_client`, an async client shared by all
+        conversations (one is created if not given). Its connections belong to the event
+        loop of one run, so the runner closes it afterwards and it is rebuilt on next use.
         """
+        self.cache = cache if cache is not None else ToolResultCache()
+        self._http = http_client if http_client is not None else self._build_http_client()
+        # Maps each LLM-facing tool name to the bound method implementing it; the
+        # method's keyword parameters match the tool's JSON schema properties
+        self.dispatch = {
+            "search_and_summarize": self.search_and_summarize,
+            "search_wikipedia": self.search,
+            "fetch_wikipedia_page": self.fetch_page,
+            "fetch_wikipedia_pages": self.fetch_pages,
+            "wikipedia_assist": self.assist,
+        }
         logger.info("WikipediaToolHandler initialized")
 
-    def search(self, query: str):
+    @staticmethod
+    def _build_http_client():
+        """
+        Builds the async HTTP client used for every MediaWiki call: one keep-alive
+        pool, HTTP/2 so concurrent calls multiplex over a single connection, and
+        connection-level retries for transient failures.
+        """
+        return httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT},
+            timeout=REQUEST_TIMEOUT,
+            # Pool and protocol settings live on the transport, which owns the connections
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=3,
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+            ),
+        )
+
+    async def warm_up(self):
+        """
+        Opens a connection to Wikipedia up front so the first tool call
+        does not pay the TCP/TLS handshake.
+        """
+        try:
+            await self.http.head(WIKIPEDIA_API_URL)
+            logger.debug("Wikipedia connection pool warmed up")
+        except httpx.HTTPError as e:
+            logger.warning("Wikipedia warm-up request failed: %s", e)
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """The MediaWiki HTTP client, rebuilt if an earlier run closed it."""
+        if self._http.is_closed:
+            logger.debug("Rebuilding closed Wikipedia HTTP client")
+            self._http = self._build_http_client()
+        return self._http
+
+    async def aclose(self):
+        """
+        Cancels cached lookups still in flight, then closes the async HTTP client;
+        the next call through `http` opens a fresh one.
+        """
+        await self.cache.drain()
+        await self._http.aclose()
+
+    async def _api_get(self, params: dict) -> dict:
+        """
+        Calls the MediaWiki action API with `params` and returns the decoded JSON.
+        Raises on HTTP errors and on API-level error payloads.
+        """
+        response = await self.http.get(
+            WIKIPEDIA_API_URL, params={"action": "query", "format": "json", **params}
+        )
+        response.raise_for_status()
+        # orjson decodes the raw body bytes directly, skipping httpx's text decode step
+        data = orjson.loads(response.content)
+        if "error" in data:
+            raise RuntimeError(data["error"].get("info", "MediaWiki API error"))
+        return data
+
+    async def search(self, query: str = ""):
         """
         Searches Wikipedia for a given query string.
         Returns up to 5 page titles or an error message.
         """
-        logger.info(f"Calling search_wikipedia with query: '{query}'")
+        logger.info("Calling search_wikipedia with query: '%s'", query)
         try:
-            results = wikipedia.search(query, results=5)
-            logger.debug(f"search_wikipedia results: {results}")
-            return results
+            return await self.cache.fetch(
+                ("search", _query_key(query)), lambda: self._search(query)
+            )
         except Exception as e:
-            logger.error(f"search_wikipedia error: {e}")
+            logger.error("search_wikipedia error: %s", e)
             return [f"Error: {str(e)}"]
 
-    def fetch_page(self, title: str):
+    async def _search(self, query: str):
+        data = await self._api_get(
+            {"list": "search", "srsearch": query, "srlimit": 5, "srprop": ""}
+        )
+        results = [page["title"] for page in data["query"]["search"]]
+        logger.debug("search_wikipedia results: %s", results)
+        return results
+
+    async def fetch_page(self, title: str = ""):
         """
         Retrieves a short summary (2 sentences) for a Wikipedia page by its title.
-        Handles PageError and DisambiguationError gracefully.
+        Handles missing pages and disambiguation pages gracefully.
         """
-        logger.info(f"Calling fetch_wikipedia_page with title: '{title}'")
+        logger.info("Calling fetch_wikipedia_page with title: '%s'", title)
         try:
-            summary = wikipedia.summary(title, sentences=2)
-            result = {"title": title, "summary": summary}
-            logger.debug(f"fetch_wikipedia_page result: {result}")
-            return result
-        except wikipedia.exceptions.PageError:
+            return await self.cache.fetch(
+                ("fetch_page", str(title).strip()), lambda: self._fetch_page(title)
+            )
+        except Exception as e:
+            error = {"error": f"Error: {str(e)}"}
+            logger.error("Unexpected error in fetch_wikipedia_page: %s", e)
+            return error
+
+    async def _fetch_page(self, title: str):
+        # Missing and disambiguation pages are answers rather than failures, so they
+        # are cached too; transport and server errors raise and are not
+        response = await self.http.get(
+            WIKIPEDIA_SUMMARY_URL + quote(str(title).strip().replace(" ", "_"), safe=""),
+            follow_redirects=True,
+        )
+        if response.status_code == 404:
             error = {"error": f"No Wikipedia page found for '{title}'."}
-            logger.warning(error["error"])
+            logger.warning("No Wikipedia page found for '%s'.", title)
+            # The wikipedia library auto-corrected misspelled titles; the REST endpoint
+            # does not, so hand back MediaWiki's spelling suggestion for a retry instead
+            suggestion = await self.assist(mode="suggest", query=title)
+            if suggestion != "No suggestion found" and not suggestion.startswith("Error"):
+                error["suggestion"] = suggestion
             return error
-        except wikipedia.exceptions.DisambiguationError as e:
-            error = {"error": "Disambiguation error", "options": e.options}
-            logger.warning(f"Disambiguation for '{title}': Options: {e.options}")
+        response.raise_for_status()
+        data = orjson.loads(response.content)
+
+        if data.get("type") == "disambiguation":
+            # The summary endpoint carries no option list; related titles stand in for it
+            options = await self.search(title)
+            error = {"error": "Disambiguation error", "options": options}
+            logger.warning("Disambiguation for '%s': Options: %s", title, options)
             return error
+
+        sentences = _SENTENCE_END_RE.split(data.get("extract", "").strip(), maxsplit=2)
+        summary = " ".join(sentences[:2])
+        result = {"title": data.get("title", title), "summary": summary}
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("fetch_wikipedia_page result: %s", result)
+        return result
+
+    async def fetch_pages(self, titles: list = None):
+        """
+        Retrieves short summaries for several Wikipedia pages at once.
+        Uncached titles are fetched in one MediaWiki request per MAX_TITLES_PER_REQUEST;
+        if a batch request fails, its titles fall back to individual fetch_page calls.
+        Returns a {title: summary} mapping; titles without a summary map to fetch_page's
+        error result instead (missing pages, disambiguation options).
+        """
+        logger.info("Calling fetch_wikipedia_pages with titles: %s", titles)
+        if isinstance(titles, str):
+            titles = [titles]
+        titles = list(dict.fromkeys(str(title).strip() for title in titles or []))
+
+        results = {}
+        missing = []
+        for title in titles:
+            # Batched extracts have their own cache namespace: fetch_page results are
+            # built differently (REST summary, spelling suggestions on 404)
+            cached = self.cache.get(("fetch_extract", title))
+            if cached is None:
+                missing.append(title)
+            else:
+                results[title] = _page_entry(cached)
+
+        for start in range(0, len(missing), MAX_TITLES_PER_REQUEST):
+            chunk = missing[start : start + MAX_TITLES_PER_REQUEST]
+            try:
+                pages = await self._fetch_extracts(chunk)
+            except Exception as e:
+                logger.warning("Batched page fetch failed (%s); fetching titles one by one", e)
+                fetched = await asyncio.gather(*(self.fetch_page(title) for title in chunk))
+                for title, page in zip(chunk, fetched):
+                    results[title] = _page_entry(page)
+                continue
+            for title in chunk:
+                page = pages[title]
+                self.cache.set(("fetch_extract", title), page)
+                results[title] = _page_entry(page)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("fetch_wikipedia_pages results: %s", results)
+        return results
+
+    async def _fetch_extracts(self, titles: list) -> dict:
+        """
+        Fetches 2-sentence intro extracts for `titles` in a single request and returns
+        results keyed by the requested titles: {"title", "summary"} for articles, and
+        errors for missing and disambiguation pages (the latter with search options).
+        """
+        data = await self._api_get(
+            {
+                "titles": "|".join(titles),
+                "prop": "extracts|pageprops",
+                "ppprop": "disambiguation",
+                "exintro": 1,
+                "explaintext": 1,
+                "exsentences": 2,
+                "exlimit": "max",
+                "redirects": 1,
+            }
+        )
+        query = data.get("query", {})
+        # Follow title normalization and redirects back to the titles that were asked for
+        normalized = {entry["from"]: entry["to"] for entry in query.get("normalized", [])}
+        redirects = {entry["from"]: entry["to"] for entry in query.get("redirects", [])}
+        pages = {page["title"]: page for page in query.get("pages", {}).values()}
+
+        results = {}
+        ambiguous = []
+        for title in titles:
+            resolved = normalized.get(title, title)
+            resolved = redirects.get(resolved, resolved)
+            page = pages.get(resolved)
+            if page is None or "missing" in page or "invalid" in page:
+                results[title] = {"error": f"No Wikipedia page found for '{title}'."}
+            elif "disambiguation" in page.get("pageprops", {}):
+                ambiguous.append(title)
+            else:
+                results[title] = {"title": page["title"], "summary": page.get("extract", "")}
+
+        # As in fetch_page, related titles stand in for the disambiguation options
+        options = await asyncio.gather(*(self.search(title) for title in ambiguous))
+        for title, found in zip(ambiguous, options):
+            results[title] = {"error": "Disambiguation error", "options": found}
+        return results
+
+    async def search_and_summarize(self, query: str = ""):
+        """
+        Searches Wikipedia and returns the top 5 matches with a 2-sentence summary each,
+        in a single MediaWiki request (search generator + intro extracts).
+        """
+        logger.info("Calling search_and_summarize with query: '%s'", query)
+        try:
+            return await self.cache.fetch(
+                ("search_and_summarize", _query_key(query)),
+                lambda: self._search_and_summarize(query),
+            )
         except Exception as e:
-            error = {"error": f"Error: {str(e)}"}
-            logger.error(f"Unexpected error in fetch_wikipedia_page: {e}")
-            return error
+            logger.error("search_and_summarize error: %s", e)
+            return [{"error": f"Error: {str(e)}"}]
+
+    async def _search_and_summarize(self, query: str):
+        data = await self._api_get(
+            {
+                "generator": "search",
+                "gsrsearch": query,
+                "gsrlimit": 5,
+                "prop": "extracts",
+                "exintro": 1,
+                "explaintext": 1,
+                "exsentences": 2,
+                "exlimit": 5,
+            }
+        )
+        # Generator results come back keyed by page id; "index" holds the search rank
+        pages = sorted(
+            data.get("query", {}).get("pages", {}).values(), key=lambda page: page.get("index", 0)
+        )
+        results = [{"title": page["title"], "summary": page.get("extract", "")} for page in pages]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("search_and_summarize results: %s", results)
+        return results
+
+    async def suggest(self, query: str):
+        """
+        Returns MediaWiki's spelling suggestion for `query` (the search "did you mean").
+        """
+        data = await self._api_get(
+            {
+                "list": "search",
+                "srsearch": query,
+                "srinfo": "suggestion",
+                "srprop": "",
+                "srlimit": 1,
+            }
+        )
+        suggestion = data.get("query", {}).get("searchinfo", {}).get("suggestion")
+        logger.debug("suggest('%s') -> %s", query, suggestion)
+        return suggestion or "No suggestion found"
 
-    def assist(self, mode: str, **kwargs):
+    async def assist(self, mode: str = None, query: str = "", latitude=None, longitude=None):
         """
         Provides assistance for either:
         - 'suggest': to correct spelling of Wikipedia titles.
         - 'geosearch': to find pages near specified coordinates.
         Returns suggestions, geosearch results, or errors.
         """
-        logger.info(f"Calling wikipedia_assist with mode='{mode}' and args={kwargs}")
+        logger.info(
+            "Calling wikipedia_assist with mode='%s', query='%s', latitude=%s, longitude=%s",
+            mode,
+            query,
+            latitude,
+            longitude,
+        )
         try:
             if mode == "suggest":
-                query = kwargs.get("query", "")
-                suggestion = wikipedia.suggest(query)
-                logger.debug(f"suggest('{query}') -> {suggestion}")
-                return suggestion or "No suggestion found"
+                return await self.cache.fetch(
+                    ("suggest", _query_key(query)),
+                    lambda: self.suggest(query),
+                )
             elif mode == "geosearch":
-                lat = kwargs.get("latitude")
-                lon = kwargs.get("longitude")
+                lat = latitude
+                lon = longitude
                 if lat is None or lon is None:
                     logger.warning("geosearch called without coordinates.")
                     return "Error: No coordinates provided."
-                geo_results = wikipedia.geosearch(lat, lon)
-                logger.debug(f"geosearch({lat}, {lon}) -> {geo_results}")
-                return {"latitude": lat, "longitude": lon, "results": geo_results}
-            logger.warning(f"Invalid mode passed to wikipedia_assist: '{mode}'")
+                return await self.cache.fetch(
+                    ("geosearch", _coordinate_key(lat), _coordinate_key(lon)),
+                    lambda: self._geosearch(lat, lon),
+                )
+            logger.warning("Invalid mode passed to wikipedia_assist: '%s'", mode)
             return "Invalid mode"
         except Exception as e:
-            logger.error(f"wikipedia_assist error: {e}")
+            logger.error("wikipedia_assist error: %s", e)
             return f"Error: {str(e)}"
+
+    async def _geosearch(self, latitude, longitude):
+        data = await self._api_get(
+            {
+                "list": "geosearch",
+                "gscoord": f"{latitude}|{longitude}",
+                "gsradius": 1000,
+                "gslimit": 10,
+            }
+        )
+        geo_results = [page["title"] for page in data["query"]["geosearch"]]
+        logger.debug("geosearch(%s, %s) -> %s", latitude, longitude, geo_results)
+        # The caller already knows the coordinates, so only the titles are returned
+        return geo_results
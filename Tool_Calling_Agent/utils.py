@@ -1,6 +1,19 @@
-import json
+import ast
 import re
+from collections import OrderedDict
 from Tool_Calling_Agent.logger import logger
+from Tool_Calling_Agent.tool_definitions import functions
+
+# Compiled once at import: a candidate call like name(...), spanning lines and
+# running to the last closing parenthesis (trimmed back if that does not parse)
+_CALL_RE = re.compile(r"(\w+)\((.*)\)", re.DOTALL)
+# Where candidate calls start, so prose before the tool call is skipped over
+_CALL_START_RE = re.compile(r"\b(\w+)\(")
+
+# Parameter names in schema order per tool, for mapping positional arguments
+_PARAMETERS = {
+    f["function"]["name"]: list(f["function"]["parameters"]["properties"]) for f in functions
+}
 
 
 class FunctionCallParser:
@@ -15,30 +28,92 @@ class FunctionCallParser:
         Parses a string like 'function_name(arg1="val", arg2=42)' into:
         - function name (str)
         - arguments (dict)
+        Only calls to known tools are recognized; positional arguments are mapped
+        to the tool's parameters in schema order.
         """
-        logger.debug(f"Attempting to parse function call from text: {text}")
-        pattern = r"(\w+)\((.*?)\)"
-        match = re.search(pattern, text)
-        if not match:
-            logger.warning("No function call pattern matched.")
-            return None, {}
-
-        func_name = match.group(1)
-        raw_args = match.group(2)
-        args = {}
-
-        logger.debug(f"Matched function: {func_name}, raw args: {raw_args}")
-        args_list = [arg.strip() for arg in raw_args.split(",")]
-
-        for arg in args_list:
-            if "=" in arg:
-                try:
-                    key, value = arg.split("=", 1)
-                    args[key.strip()] = value.strip().strip('"').strip("'")
-                except ValueError as ve:
-                    logger.warning(f"Failed to parse argument: {arg} -> {ve}")
-            else:
-                logger.debug(f"Ignored non-keyword argument: {arg}")
-
-        logger.info(f"Parsed function: {func_name} with args: {args}")
-        return func_name, args
+        logger.debug("Attempting to parse function call from text: %s", text)
+        for start in _CALL_START_RE.finditer(text):
+            if start.group(1) not in _PARAMETERS:
+                continue
+            match = _CALL_RE.match(text, start.start())
+            if match is None:
+                # No closing parenthesis after the name, e.g. a truncated call
+                continue
+            node, source = FunctionCallParser._parse_call(match.group(0))
+            if node is None:
+                continue
+
+            func_name = node.func.id
+            names = _PARAMETERS[func_name]
+            args = {
+                name: FunctionCallParser._literal(value, source)
+                for name, value in zip(names, node.args)
+            }
+            args.update(
+                (kw.arg, FunctionCallParser._literal(kw.value, source))
+                for kw in node.keywords
+                if kw.arg is not None
+            )
+
+            logger.info("Parsed function: %s with args: %s", func_name, args)
+            return func_name, args
+
+        logger.warning("No function call pattern matched.")
+        return None, {}
+
+    @staticmethod
+    def _parse_call(span):
+        """
+        Returns (Call node, source) for the longest prefix of `span` ending in ')'
+        that parses as a plain `name(...)` call, or (None, None).
+        """
+        end = len(span)
+        while end > 0:
+            source = span[:end]
+            try:
+                node = ast.parse(source, mode="eval").body
+            except SyntaxError:
+                node = None
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+                return node, source
+            end = span.rfind(")", 0, end - 1) + 1
+        return None, None
+
+    @staticmethod
+    def _literal(node, source):
+        # Bare words such as query=Greece are taken as strings, as before
+        try:
+            return ast.literal_eval(node)
+        except (ValueError, TypeError, SyntaxError):
+            return ast.get_source_segment(source, node)
+
+
+class BoundedKeySet:
+    """
+    Set-like record of recently seen keys, capped at `max_entries`.
+    Adding a key beyond the cap evicts the least recently added one, so per-conversation
+    dedup state stays bounded however long the loop runs.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._keys = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key):
+        self._keys[key] = None
+        self._keys.move_to_end(key)
+        if len(self._keys) > self.max_entries:
+            self._keys.popitem(last=False)
+
+    def discard(self, key):
+        self._keys.pop(key, None)
+
+    def update(self, keys):
+        for key in keys:
+            self.add(key)